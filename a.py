@@ -2,7 +2,14 @@ import chess
 import pygame
 import sys
 import os
+import math
+import asyncio
+import concurrent.futures
+import functools
+import threading
+from collections import OrderedDict
 import chess.engine
+import chess.polyglot
 from pygame.locals import *
 
 # ------------ 실행 경로 설정 (EXE에서도 동작) ------------
@@ -25,6 +32,15 @@ HIGHLIGHT = (255, 215, 0)
 GRAY = (200, 200, 200)
 BG = (18, 18, 18)
 
+# 칸 번호(0..63) -> 화면 좌표 테이블 (매 프레임 좌표 계산을 피하기 위해 미리 계산)
+SQUARE_RECTS = [None] * 64
+SQUARE_TO_SCREEN = [None] * 64
+for _sq in range(64):
+    _px = (_sq & 7) * SQUARE_SIZE
+    _py = (7 - (_sq >> 3)) * SQUARE_SIZE
+    SQUARE_RECTS[_sq] = pygame.Rect(_px, _py, SQUARE_SIZE, SQUARE_SIZE)
+    SQUARE_TO_SCREEN[_sq] = (_px, _py)
+
 pygame.init()
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("체스 게임")
@@ -41,15 +57,17 @@ for color in ['w', 'b']:
     for piece in PIECE_TYPES:
         symbol = piece.upper() if color == 'w' else piece
         image_path = resource_path(f"images/{color}{piece}.png")
-        if os.path.exists(image_path):
-            try:
-                img = pygame.image.load(image_path).convert_alpha()
-                PIECE_IMAGES[symbol] = pygame.transform.smoothscale(img, (SQUARE_SIZE, SQUARE_SIZE))
-            except Exception as e:
-                print(f"이미지 로드 실패: {image_path} -> {e}")
-                PIECE_IMAGES[symbol] = None
-                missing_images.append(image_path)
-        else:
+        # 존재 여부를 따로 확인하지 않고 바로 열어 봄(실패하면 폴백)
+        try:
+            img = pygame.image.load(image_path).convert_alpha()
+            # smoothscale 결과도 화면 픽셀 포맷으로 다시 변환해야 blit 시 포맷 변환이 없음
+            scaled = pygame.transform.smoothscale(img, (SQUARE_SIZE, SQUARE_SIZE))
+            PIECE_IMAGES[symbol] = scaled.convert_alpha()
+        except FileNotFoundError:
+            PIECE_IMAGES[symbol] = None
+            missing_images.append(image_path)
+        except Exception as e:
+            print(f"이미지 로드 실패: {image_path} -> {e}")
             PIECE_IMAGES[symbol] = None
             missing_images.append(image_path)
 
@@ -66,201 +84,398 @@ UNICODE_PIECES = {
     'R': '♖', 'N': '♘', 'B': '♗', 'Q': '♕', 'K': '♔', 'P': '♙',
 }
 
+# 폴백 글리프는 시작할 때 한 번만 렌더링해 칸 크기 surface에 가운데 정렬해 둠
+for sym, glyph in UNICODE_PIECES.items():
+    # 이미지가 없으면 폴백으로 채워서 그리기 경로는 딕셔너리 조회 + blit 한 번으로 끝나게 함
+    if PIECE_IMAGES.get(sym) is None:
+        text = piece_font.render(glyph, True, (0, 0, 0))
+        surf = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+        surf.blit(text, text.get_rect(center=(SQUARE_SIZE // 2, SQUARE_SIZE // 2)))
+        PIECE_IMAGES[sym] = surf.convert_alpha()
+
+# 승진 선택 UI 배치와 축소 아이콘은 고정이므로 시작할 때 한 번만 만듦
+PROMO_OPTIONS = ['q', 'r', 'b', 'n']
+PROMO_SIZE = SQUARE_SIZE // 2
+PROMO_RECTS = [pygame.Rect(BOARD_SIZE + 20, 40 + i * (PROMO_SIZE + 10), PROMO_SIZE, PROMO_SIZE)
+               for i in range(len(PROMO_OPTIONS))]
+PROMO_ICONS = {}
+for color in ['w', 'b']:
+    for piece in PROMO_OPTIONS:
+        symbol = piece.upper() if color == 'w' else piece
+        icon = pygame.transform.smoothscale(PIECE_IMAGES[symbol], (PROMO_SIZE, PROMO_SIZE))
+        PROMO_ICONS[(color, piece)] = icon.convert_alpha()
+
 # ------------ 보드 초기화 ------------
 board = chess.Board()
 selected_square = None
-legal_moves = []
+legal_moves_by_from = {}    # 출발 칸 -> 합법 수 목록 (현재 포지션 기준 캐시)
+legal_index = {}            # (출발, 도착, 승진) -> 합법 수
 move_stack = []
 
 # ------------ 엔진 설정 (Stockfish) ------------
+# 엔진은 전용 스레드에서 도는 asyncio 이벤트 루프 위의 UciProtocol로 직접 다룹니다.
+# (SimpleEngine의 잠금/블로킹 호출 없이 메인 스레드에서 분석을 요청하고 결과만 받음)
 engine = None
-engine_path = resource_path(os.path.join("stockfish", "stockfish-windows-x86-64-avx2.exe"))
-if not os.path.exists(engine_path):
-    # 다른 흔한 이름도 시도해봄
-    alt = resource_path(os.path.join("stockfish", "stockfish.exe"))
-    if os.path.exists(alt):
-        engine_path = alt
-
-try:
-    if os.path.exists(engine_path):
-        engine = chess.engine.SimpleEngine.popen_uci(engine_path)
-    else:
-        engine = None
-        print("⚠️ Stockfish 엔진 파일을 찾을 수 없습니다. 승률/분석 기능 비활성화됩니다.")
-except Exception as e:
-    engine = None
-    print("엔진 실행 중 오류:", e)
+ENGINE_TIMEOUT = 10     # 엔진 시작/설정 응답 대기 시간(초)
+_engine_loop = asyncio.new_event_loop()
+threading.Thread(target=_engine_loop.run_forever, daemon=True).start()
 
-# ------------ 평가(승률) 관련 캐시 ------------
-_last_eval_fen = None
-_last_winrate = 0.5
 
-def compute_winrate():
-    global _last_eval_fen, _last_winrate
+def run_on_engine_loop(coro, timeout=None):
+    """엔진 루프에서 코루틴을 실행하고 결과를 기다립니다. 시간 초과 시 작업을 취소하고 TimeoutError를 냅니다."""
+    fut = asyncio.run_coroutine_threadsafe(coro, _engine_loop)
     try:
-        if not engine:
-            _last_winrate = 0.5
-            _last_eval_fen = board.fen()
-            return _last_winrate
-        fen = board.fen()
-        if fen == _last_eval_fen:
-            return _last_winrate
-        info = engine.analyse(board, chess.engine.Limit(time=0.05))
-        score = info.get("score")
-        if score is None:
-            _last_winrate = 0.5
-        else:
-            rel = score.relative
-            if rel.is_mate():
-                # 매트: 숫자가 양수면 백 유리
-                _last_winrate = 1.0 if rel.mate() > 0 else 0.0
-            else:
-                cp = rel.score() or 0
-                # -300..+300 -> 0..1 (단순 정규화)
-                _last_winrate = max(min((cp + 300) / 600.0, 1.0), 0.0)
-        _last_eval_fen = fen
-        return _last_winrate
+        return fut.result(timeout)
+    except concurrent.futures.TimeoutError:
+        fut.cancel()
+        raise TimeoutError(f"엔진 응답 없음 ({timeout}초)")
+
+
+async def _open_engine(path):
+    transport, protocol = await chess.engine.popen_uci(path)
+    return protocol
+
+
+# 존재 여부를 따로 확인하지 않고 바로 실행해 봄. 파일이 없으면 다른 흔한 이름도 시도
+ENGINE_CANDIDATES = [
+    resource_path(os.path.join("stockfish", "stockfish-windows-x86-64-avx2.exe")),
+    resource_path(os.path.join("stockfish", "stockfish.exe")),
+]
+for engine_path in ENGINE_CANDIDATES:
+    try:
+        engine = run_on_engine_loop(_open_engine(engine_path), timeout=ENGINE_TIMEOUT)
+        break
+    except FileNotFoundError:
+        continue
     except Exception as e:
+        print("엔진 실행 중 오류:", e)
+        break
+else:
+    print("⚠️ Stockfish 엔진 파일을 찾을 수 없습니다. 승률/분석 기능 비활성화됩니다.")
+
+if engine:
+    # 분석 스레드/해시를 늘리고 WDL(승/무/패) 정보를 받도록 설정
+    try:
+        run_on_engine_loop(engine.configure({
+            "Threads": max(1, (os.cpu_count() or 2) - 1),
+            "Hash": 128,
+            "UCI_ShowWDL": True,
+        }), timeout=ENGINE_TIMEOUT)
+    except TimeoutError as e:
+        # 응답하지 않는 엔진은 사용하지 않음
+        print("엔진 옵션 설정 실패:", e)
+        engine = None
+    except Exception as e:
+        print("엔진 옵션 설정 실패:", e)
+
+# ------------ 평가(승률) 관련 캐시 ------------
+# 엔진 분석은 엔진 루프에서 비동기로 수행하고, 메인 루프는 최신 결과만 읽습니다.
+EVAL_DEPTH = 20         # 분석 최대 깊이
+EVAL_CACHE_SIZE = 512   # 최근 포지션 평가 캐시 크기
+_latest_winrate = 0.5   # 화면에 표시 중인 값 (메인 스레드만 씀)
+_latest_depth = None
+_last_eval_key = None   # 마지막으로 요청한 포지션의 Zobrist 키
+_latest_eval = (None, 0.5, None)   # 엔진 루프가 발표한 (키, 승률, 깊이), 한 번에 교체
+_eval_cache = OrderedDict()   # Zobrist 키 -> (승률, 깊이), LRU
+_eval_cache_lock = threading.Lock()
+_eval_future = None     # 진행 중인 분석 (concurrent.futures.Future)
+
+
+def _info_to_winrate(info):
+    """분석 정보에서 백 기준 승률(0..1)을 구합니다. 엔진이 준 WDL이 있으면 그것을 우선 사용합니다."""
+    wdl = info.get("wdl")
+    if wdl is not None:
+        return wdl.white().expectation()
+    score = info.get("score")
+    if score is None:
+        return 0.5
+    pov = score.white()
+    if pov.is_mate():
+        # 매트: 이미 체크메이트된 포지션(mate 0)도 승패 방향이 맞도록 WDL로 변환
+        return pov.wdl().expectation()
+    # 센티폰 -> 승률: 시그모이드(tanh)로 부드럽게 변환 (양 끝에서 잘리지 않음)
+    return 0.5 + 0.5 * math.tanh((pov.score() or 0) / 400.0)
+
+
+def _remember_eval(key, winrate, depth):
+    """캐시된 값보다 얕지 않은 결과만 저장합니다. 저장했으면 True."""
+    with _eval_cache_lock:
+        cached = _eval_cache.get(key)
+        if cached is not None and (depth or 0) < (cached[1] or 0):
+            return False
+        _eval_cache[key] = (winrate, depth)
+        _eval_cache.move_to_end(key)
+        if len(_eval_cache) > EVAL_CACHE_SIZE:
+            _eval_cache.popitem(last=False)
+        return True
+
+
+def _lookup_eval(key):
+    with _eval_cache_lock:
+        cached = _eval_cache.get(key)
+        if cached is not None:
+            _eval_cache.move_to_end(key)
+        return cached
+
+
+async def _analyse_position(key, pos):
+    """pos를 최대 EVAL_DEPTH까지 연속 분석하며 캐시보다 깊은 결과가 나올 때마다 _latest_eval로 발표합니다.
+    새 포지션이 요청되면 작업이 취소되고, with 블록을 빠져나가며 analysis.stop()이 호출됩니다."""
+    global _latest_eval
+    with await engine.analysis(pos, chess.engine.Limit(depth=EVAL_DEPTH)) as analysis:
+        async for _ in analysis:
+            info = analysis.info
+            if "score" not in info:
+                continue
+            winrate = _info_to_winrate(info)
+            depth = info.get("depth")
+            # 캐시된 값보다 얕은 결과로 되돌아가지 않게 함
+            if _remember_eval(key, winrate, depth):
+                _latest_eval = (key, winrate, depth)
+
+
+def _on_eval_done(key, fut):
+    global _latest_eval
+    if fut.cancelled():
+        return
+    e = fut.exception()
+    if e is not None:
         print("엔진 분석 오류:", e)
-        _last_winrate = 0.5
-        _last_eval_fen = board.fen()
-        return _last_winrate
+        # 이미 다른 포지션을 보여 주고 있으면 화면 값은 건드리지 않음
+        if key == _last_eval_key:
+            _latest_eval = (key, 0.5, None)
+
+
+def request_eval():
+    """현재 보드 상태의 분석을 엔진 루프에 요청합니다.
+    최근에 분석한 포지션이면 캐시된 값을 바로 쓰고, 최대 깊이까지 끝난 경우 엔진을 다시 돌리지 않습니다."""
+    global _latest_winrate, _latest_depth, _last_eval_key, _eval_future
+    if not engine:
+        _latest_winrate = 0.5
+        _latest_depth = None
+        return
+    key = chess.polyglot.zobrist_hash(board)
+    if key == _last_eval_key:
+        return
+    _last_eval_key = key
+    # 이전 포지션 분석은 취소
+    if _eval_future is not None:
+        _eval_future.cancel()
+        _eval_future = None
+    cached = _lookup_eval(key)
+    if cached is None:
+        _latest_depth = None
+    else:
+        _latest_winrate, _latest_depth = cached
+        if (_latest_depth or 0) >= EVAL_DEPTH:
+            return
+    _eval_future = asyncio.run_coroutine_threadsafe(_analyse_position(key, board.copy()), _engine_loop)
+    _eval_future.add_done_callback(functools.partial(_on_eval_done, key))
+
+
+def compute_winrate():
+    # 블로킹 없이 가장 최근 분석 결과를 반환 (다른 포지션의 결과는 무시)
+    global _latest_winrate, _latest_depth
+    key, winrate, depth = _latest_eval
+    if key == _last_eval_key:
+        _latest_winrate, _latest_depth = winrate, depth
+    return _latest_winrate
+
+
+request_eval()
 
 # ------------ 보드/렌더링 함수 ------------
 
-def draw_board():
-    # 체스판 그리기
-    light = (240, 217, 181)
-    dark = (181, 136, 99)
-    for r in range(8):
-        for f in range(8):
-            color = light if (r + f) % 2 == 0 else dark
-            rect = pygame.Rect(f * SQUARE_SIZE, r * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-            pygame.draw.rect(screen, color, rect)
-            sq = chess.square(f, 7 - r)
-            piece = board.piece_at(sq)
-            if piece:
-                sym = piece.symbol()
-                img = PIECE_IMAGES.get(sym)
-                if img:
-                    screen.blit(img, rect.topleft)
-                else:
-                    glyph = UNICODE_PIECES.get(sym, '?')
-                    text = piece_font.render(glyph, True, (0, 0, 0))
-                    tr = text.get_rect(center=rect.center)
-                    screen.blit(text, tr)
+# 빈 체스판(칸 무늬)은 시작할 때 한 번만 그려 둠
+LIGHT_SQUARE = (240, 217, 181)
+DARK_SQUARE = (181, 136, 99)
+EMPTY_BOARD_SURF = pygame.Surface((BOARD_SIZE, BOARD_SIZE)).convert()
+for r in range(8):
+    for f in range(8):
+        color = LIGHT_SQUARE if (r + f) % 2 == 0 else DARK_SQUARE
+        EMPTY_BOARD_SURF.fill(color, (f * SQUARE_SIZE, r * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+
+# 가능한 이동 표시용 점: 한 번만 그려 두고 blit
+DOT_RADIUS = 8
+DOT_SURF = pygame.Surface((DOT_RADIUS * 2 + 1, DOT_RADIUS * 2 + 1), pygame.SRCALPHA)
+pygame.draw.circle(DOT_SURF, GREEN, (DOT_RADIUS, DOT_RADIUS), DOT_RADIUS)
+DOT_SURF = DOT_SURF.convert_alpha()
+
+# 보드(칸+기물) 렌더링 결과 캐시: 보드 상태가 바뀔 때만 다시 그림
+BOARD_RECT = pygame.Rect(0, 0, BOARD_SIZE, BOARD_SIZE)
+_board_surf = pygame.Surface((BOARD_SIZE, BOARD_SIZE)).convert()
+_board_dirty = True
+_marked_squares = set()   # 직전 프레임에 강조 표시한 칸들
+
+# 이번 프레임에 다시 그린 화면 영역 (display.update에 넘김)
+dirty = []
+
+
+def _render_board_to(surf):
+    # 빈 체스판 위에 기물 그리기
+    surf.blit(EMPTY_BOARD_SURF, (0, 0))
+    # piece_map()은 기물이 있는 칸만 돌려줌
+    for sq, piece in board.piece_map().items():
+        surf.blit(PIECE_IMAGES[piece.symbol()], SQUARE_TO_SCREEN[sq])
+
+
+def draw_board(full=False):
+    """보드를 그리고 바뀐 영역을 dirty에 추가합니다.
+    보드 상태가 그대로면 이전/현재 강조 칸만 캐시에서 복원해 다시 그립니다."""
+    global _board_dirty, _marked_squares
+    if _board_dirty:
+        _render_board_to(_board_surf)
+        _board_dirty = False
+        full = True
+
+    moves = legal_moves_by_from.get(selected_square, [])
+    marked = {mv.to_square for mv in moves}
+    if selected_square is not None:
+        marked.add(selected_square)
+    if full:
+        screen.blit(_board_surf, (0, 0))
+        dirty.append(BOARD_RECT)
+    else:
+        for sq in marked | _marked_squares:
+            rect = SQUARE_RECTS[sq]
+            screen.blit(_board_surf, rect, rect)
+            dirty.append(rect)
+    _marked_squares = marked
 
     # 선택한 칸 강조
     if selected_square is not None:
-        sf = chess.square_file(selected_square)
-        sr = 7 - chess.square_rank(selected_square)
-        sel_rect = pygame.Rect(sf * SQUARE_SIZE, sr * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-        pygame.draw.rect(screen, HIGHLIGHT, sel_rect, 3)
+        pygame.draw.rect(screen, HIGHLIGHT, SQUARE_RECTS[selected_square], 3)
 
     # 가능한 이동 강조
-    for mv in legal_moves:
-        if mv.from_square == selected_square:
-            to_sq = mv.to_square
-            tf = chess.square_file(to_sq)
-            tr = 7 - chess.square_rank(to_sq)
-            center = (tf * SQUARE_SIZE + SQUARE_SIZE // 2, tr * SQUARE_SIZE + SQUARE_SIZE // 2)
-            pygame.draw.circle(screen, GREEN, center, 8)
+    for mv in moves:
+        cx, cy = SQUARE_RECTS[mv.to_square].center
+        screen.blit(DOT_SURF, (cx - DOT_RADIUS, cy - DOT_RADIUS))
+
+
+# 승률 막대 렌더링 캐시: (0.5% 단위 승률, 깊이)가 바뀔 때만 다시 그림
+BAR_X = BOARD_SIZE + 20
+BAR_Y = 20
+BAR_W = 30
+BAR_H = HEIGHT - 40
+BAR_ORIGIN = (BAR_X - 10, 0)
+_bar_surf = pygame.Surface((BAR_W + 80, HEIGHT)).convert()
+BAR_RECT = _bar_surf.get_rect(topleft=BAR_ORIGIN)
+_last_bar_state = None
+
+
+def _render_winrate_bar(wr_q, depth):
+    # 막대 영역 surface 기준 좌표로 그림
+    x = BAR_X - BAR_ORIGIN[0]
+    _bar_surf.fill(BG)
+    _bar_surf.fill(GRAY, (x, BAR_Y, BAR_W, BAR_H))
+    white_h = int(BAR_H * wr_q / 200)
+    _bar_surf.fill((255, 255, 255), (x, BAR_Y, BAR_W, white_h))
+    _bar_surf.fill((40, 40, 40), (x, BAR_Y + white_h, BAR_W, BAR_H - white_h))
+    # 퍼센트 텍스트
+    txt = ui_font.render(f"White: {wr_q // 2}%", True, (255,255,255))
+    _bar_surf.blit(txt, (0, BAR_Y + BAR_H + 5))
+    # 분석 깊이 표시
+    if depth is not None:
+        depth_txt = ui_font.render(f"depth {depth}", True, GRAY)
+        _bar_surf.blit(depth_txt, (0, 4))
 
 
 def draw_winrate_bar(winrate):
     # 오른쪽에 승률 막대 표시
-    bar_x = BOARD_SIZE + 20
-    bar_y = 20
-    bar_w = 30
-    bar_h = HEIGHT - 40
-    pygame.draw.rect(screen, GRAY, (bar_x, bar_y, bar_w, bar_h))
-    white_h = int(bar_h * winrate)
-    pygame.draw.rect(screen, (255, 255, 255), (bar_x, bar_y, bar_w, white_h))
-    pygame.draw.rect(screen, (40, 40, 40), (bar_x, bar_y + white_h, bar_w, bar_h - white_h))
-    # 퍼센트 텍스트
-    txt = ui_font.render(f"White: {int(winrate*100)}%", True, (255,255,255))
-    screen.blit(txt, (bar_x - 10, bar_y + bar_h + 5))
+    global _last_bar_state
+    state = (round(winrate * 200), _latest_depth)
+    if state != _last_bar_state:
+        _render_winrate_bar(*state)
+        _last_bar_state = state
+    screen.blit(_bar_surf, BAR_ORIGIN)
+    dirty.append(BAR_RECT)
 
 
 def get_square_under_mouse(pos):
     x, y = pos
     if x < 0 or x >= BOARD_SIZE or y < 0 or y >= BOARD_SIZE:
         return None
-    file = x // SQUARE_SIZE
-    rank = 7 - (y // SQUARE_SIZE)
-    return chess.square(file, rank)
+    return ((7 - (y // SQUARE_SIZE)) << 3) | (x // SQUARE_SIZE)
 
 
 def prompt_promotion(color_is_white):
     # 승진 선택 UI (우측 영역에 표시)
-    options = ['q', 'r', 'b', 'n']
-    rects = []
-    base_x = BOARD_SIZE + 20
-    base_y = 40
-    for i, p in enumerate(options):
-        rect = pygame.Rect(base_x, base_y + i * (SQUARE_SIZE // 2 + 10), SQUARE_SIZE // 2, SQUARE_SIZE // 2)
-        pygame.draw.rect(screen, GRAY, rect)
-        key = p.upper() if color_is_white else p
-        img = PIECE_IMAGES.get(key)
-        if img:
-            img_s = pygame.transform.smoothscale(img, (rect.w, rect.h))
-            screen.blit(img_s, rect.topleft)
-        else:
-            glyph = UNICODE_PIECES.get(key, '?')
-            text = piece_font.render(glyph, True, (0,0,0))
-            tr = text.get_rect(center=rect.center)
-            screen.blit(text, tr)
-        rects.append((rect, p))
+    color = 'w' if color_is_white else 'b'
+    for rect, p in zip(PROMO_RECTS, PROMO_OPTIONS):
+        screen.fill(GRAY, rect)
+        screen.blit(PROMO_ICONS[(color, p)], rect.topleft)
     pygame.display.flip()
 
     # 클릭 대기
     while True:
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == MOUSEBUTTONDOWN:
-                for rect, piece in rects:
-                    if rect.collidepoint(event.pos):
-                        return piece
-            if event.type == KEYDOWN:
-                # 키로도 선택 가능: q/r/b/n
-                if event.unicode.lower() in ['q','r','b','n']:
-                    return event.unicode.lower()
-        clock.tick(30)
+        # 다음 이벤트가 올 때까지 블로킹 대기
+        event = pygame.event.wait()
+        if event.type == QUIT:
+            pygame.quit()
+            sys.exit()
+        if event.type == MOUSEBUTTONDOWN:
+            for rect, piece in zip(PROMO_RECTS, PROMO_OPTIONS):
+                if rect.collidepoint(event.pos):
+                    return piece
+        if event.type == KEYDOWN:
+            # 키로도 선택 가능: q/r/b/n
+            if event.unicode.lower() in PROMO_OPTIONS:
+                return event.unicode.lower()
+
+
+PROMO_PIECE_TYPES = {'q': chess.QUEEN, 'r': chess.ROOK, 'b': chess.BISHOP, 'n': chess.KNIGHT}
 
 
 def try_make_move(from_sq, to_sq):
     """승진 처리 포함해서 실제로 수를 두려고 시도합니다. 성공하면 True 반환."""
-    piece = board.piece_at(from_sq)
-    if piece is None:
+    global _board_dirty
+    # 선택 시 만든 (출발, 도착, 승진) 인덱스로 검사 (수 생성을 다시 돌리지 않음)
+    prom = None
+    if (from_sq, to_sq, chess.QUEEN) in legal_index:
+        # 합법적인 승진 수일 때만 선택 UI를 띄움
+        prom = PROMO_PIECE_TYPES.get(prompt_promotion(board.turn == chess.WHITE), chess.QUEEN)
+    move = legal_index.get((from_sq, to_sq, prom))
+    if move is None:
         return False
-    # 승진 검사: 폰이 마지막 랭크로 이동하는 경우
-    if piece.piece_type == chess.PAWN and chess.square_rank(to_sq) in (0, 7):
-        color_white = piece.color == chess.WHITE
-        prom = prompt_promotion(color_white)
-        prom_map = {'q': chess.QUEEN, 'r': chess.ROOK, 'b': chess.BISHOP, 'n': chess.KNIGHT}
-        move = chess.Move(from_sq, to_sq, promotion=prom_map.get(prom, chess.QUEEN))
-    else:
-        move = chess.Move(from_sq, to_sq)
-
-    if move in board.legal_moves:
-        board.push(move)
-        move_stack.append(move)
-        return True
-    return False
+    board.push(move)
+    move_stack.append(move)
+    _board_dirty = True
+    return True
 
 # ------------ 메인 루프 ------------
 running = True
+full_redraw = True      # 화면 전체를 다시 그려야 하는 경우(시작, 창 노출)
+board_changed = False   # 보드/선택 상태가 바뀐 경우
+bar_changed = False     # 승률 막대 영역을 다시 그려야 하는 경우
+last_winrate = None
+last_depth = None
 while running:
-    screen.fill(BG)
-    draw_board()
     winrate = compute_winrate()
-    draw_winrate_bar(winrate)
+    if last_winrate is None or abs(winrate - last_winrate) > 0.005 or _latest_depth != last_depth:
+        last_winrate = winrate
+        last_depth = _latest_depth
+        bar_changed = True
 
-    pygame.display.flip()
+    if full_redraw:
+        screen.fill(BG)
+    if full_redraw or board_changed:
+        draw_board(full_redraw)
+        board_changed = False
+    if full_redraw or bar_changed:
+        draw_winrate_bar(last_winrate)
+        bar_changed = False
+    if full_redraw:
+        pygame.display.flip()
+        full_redraw = False
+        dirty.clear()
+    elif dirty:
+        # 바뀐 영역만 화면에 반영 (변화가 없으면 update 자체를 건너뜀)
+        pygame.display.update(dirty)
+        dirty.clear()
 
-    for event in pygame.event.get():
+    # 이벤트가 없으면 최대 33ms 동안 대기(유휴 시 CPU 사용 최소화)
+    events = [pygame.event.wait(33)] + pygame.event.get()
+    for event in events:
         if event.type == QUIT:
             running = False
             break
@@ -268,36 +483,54 @@ while running:
             if event.key == K_u and move_stack:
                 board.pop()
                 move_stack.pop()
-                # 평가 캐시 초기화
-                _last_eval_fen = None
+                selected_square = None
+                legal_moves_by_from = {}
+                legal_index = {}
+                _board_dirty = True
+                board_changed = True
+                # 되돌린 보드 상태 분석 요청
+                request_eval()
             elif event.key == K_ESCAPE:
                 running = False
                 break
+        elif event.type == VIDEOEXPOSE:
+            full_redraw = True
         elif event.type == MOUSEBUTTONDOWN:
             sq = get_square_under_mouse(event.pos)
             if sq is None:
                 # 우측 영역 클릭은 무시(또는 UI 버튼용으로 사용 가능)
                 continue
+            board_changed = True
             if selected_square is None:
                 piece = board.piece_at(sq)
                 if piece and piece.color == board.turn:
                     selected_square = sq
-                    legal_moves = list(board.legal_moves)
+                    legal_moves_by_from = {}
+                    legal_index = {}
+                    for m in board.legal_moves:
+                        legal_moves_by_from.setdefault(m.from_square, []).append(m)
+                        legal_index[(m.from_square, m.to_square, m.promotion)] = m
             else:
                 made = try_make_move(selected_square, sq)
                 selected_square = None
-                legal_moves = []
+                legal_moves_by_from = {}
+                legal_index = {}
                 if made:
-                    # 평가 캐시 초기화(새로운 보드 상태 분석 필요)
-                    _last_eval_fen = None
+                    # 승진 선택 UI가 막대 영역을 덮었을 수 있으므로 다시 그림
+                    bar_changed = True
+                    # 새로운 보드 상태 분석 요청
+                    request_eval()
 
     clock.tick(30)
 
 # 종료 처리
 if engine:
+    if _eval_future is not None:
+        _eval_future.cancel()
     try:
-        engine.quit()
+        run_on_engine_loop(engine.quit(), timeout=5)
     except Exception:
         pass
+_engine_loop.call_soon_threadsafe(_engine_loop.stop)
 pygame.quit()
 sys.exit()
\ No newline at end of file